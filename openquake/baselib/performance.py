@@ -22,6 +22,10 @@ import getpass
 from datetime import datetime
 import psutil
 import numpy
+try:
+    import numba
+except ImportError:
+    numba = None
 
 from openquake.baselib.general import humansize
 from openquake.baselib import hdf5
@@ -60,6 +64,17 @@ def init_performance(hdf5file, swmr=False):
         h5.close()
 
 
+def compile(func):
+    """
+    Compile a function with numba (lazily, at the first call, caching the
+    machine code on disk); if numba is not installed return the function
+    unchanged
+    """
+    if numba:
+        return numba.njit(cache=True)(func)
+    return func
+
+
 def _pairs(items):
     lst = []
     for name, value in items:
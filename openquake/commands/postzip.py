@@ -17,13 +17,53 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
 
+import io
+import os
 import json
+import uuid
 import logging
 import requests
 from openquake.baselib import sap, config
 from openquake.calculators.extract import WebAPIError
 
 
+class MultipartFile(object):
+    """
+    A file-like object returning the body of a multipart/form-data request
+    with a single file field. The file is read in chunks while sending the
+    request, so that it is never kept in memory in its entirety.
+
+    :param field: name of the form field
+    :param fileobj: a file object opened in binary mode
+    :param content_type: content type of the file
+    """
+    def __init__(self, field, fileobj, content_type='application/zip'):
+        boundary = uuid.uuid4().hex
+        self.content_type = 'multipart/form-data; boundary=%s' % boundary
+        head = ('--%s\r\nContent-Disposition: form-data; name="%s"; '
+                'filename="%s"\r\nContent-Type: %s\r\n\r\n' % (
+                    boundary, field, os.path.basename(fileobj.name),
+                    content_type)).encode('utf8')
+        tail = ('\r\n--%s--\r\n' % boundary).encode('utf8')
+        self.size = len(head) + os.fstat(fileobj.fileno()).st_size + len(tail)
+        self.parts = [io.BytesIO(head), fileobj, io.BytesIO(tail)]
+
+    def __len__(self):
+        # used by requests to set the Content-Length header
+        return self.size
+
+    def read(self, size=-1):
+        chunks = []
+        for part in self.parts:
+            chunk = part.read(size)
+            chunks.append(chunk)
+            if size >= 0:
+                size -= len(chunk)
+                if size == 0:
+                    break
+        return b''.join(chunks)
+
+
 @sap.Script
 def postzip(zipfile):
     """Post a zipfile to the WebUI"""
@@ -36,8 +76,10 @@ def postzip(zipfile):
                                  password=config.webapi.password))
         if resp.status_code != 200:
             raise WebAPIError(resp.text)
-    resp = sess.post("%s/v1/calc/run" % config.webapi.server, {},
-                     files=dict(archive=open(zipfile, 'rb')))
+    with open(zipfile, 'rb') as f:
+        body = MultipartFile('archive', f)
+        resp = sess.post("%s/v1/calc/run" % config.webapi.server, body,
+                         headers={'Content-Type': body.content_type})
     print(json.loads(resp.text))
 
 
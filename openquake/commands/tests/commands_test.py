@@ -41,6 +41,7 @@ from openquake.commands.db import db
 from openquake.commands.to_shapefile import to_shapefile
 from openquake.commands.from_shapefile import from_shapefile
 from openquake.commands.zip import zip as zip_cmd
+from openquake.commands.postzip import MultipartFile
 from openquake.commands.check_input import check_input
 from openquake.commands.prepare_site_model import prepare_site_model
 from openquake.commands import run
@@ -371,6 +372,26 @@ class ZipTestCase(unittest.TestCase):
         shutil.rmtree(dtemp)
 
 
+class PostzipTestCase(unittest.TestCase):
+    def test_multipart_file(self):
+        fname = gettemp(b'PK' * 10000, suffix='.zip')
+        with open(fname, 'rb') as f:
+            body = MultipartFile('archive', f)
+            chunks = []
+            chunk = body.read(8192)
+            while chunk:
+                chunks.append(chunk)
+                chunk = body.read(8192)
+        data = b''.join(chunks)
+        self.assertEqual(len(data), len(body))
+        boundary = body.content_type.split('boundary=')[1].encode('ascii')
+        self.assertTrue(data.startswith(b'--' + boundary + b'\r\n'))
+        self.assertIn(b'name="archive"; filename="%s"' %
+                      os.path.basename(fname).encode('utf8'), data)
+        self.assertIn(b'\r\n\r\n' + b'PK' * 10000 + b'\r\n', data)
+        self.assertTrue(data.endswith(b'--' + boundary + b'--\r\n'))
+
+
 class SourceModelShapefileConverterTestCase(unittest.TestCase):
     """
     Simple conversion test for the Source Model to shapefile converter
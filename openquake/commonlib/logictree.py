@@ -31,6 +31,7 @@ import copy
 import time
 import logging
 import itertools
+import json
 import collections
 import operator
 from collections import namedtuple
@@ -170,7 +171,7 @@ class LogicTreeError(Exception):
             self.filename, self.lineno, self.message)
 
 
-def sample(weighted_objects, num_samples, seed):
+def sample(weighted_objects, num_samples, seed, replace=True):
     """
     Take random samples of a sequence of weighted objects
 
@@ -181,6 +182,8 @@ def sample(weighted_objects, num_samples, seed):
         The number of samples to return
     :param seed:
         A random seed
+    :param replace:
+        If False, sample without replacement
     :return:
         A subsequence of the original sequence with `num_samples` elements
     """
@@ -191,12 +194,94 @@ def sample(weighted_objects, num_samples, seed):
             weights.append(w)
         else:
             weights.append(w['weight'])
-    numpy.random.seed(seed)
-    idxs = numpy.random.choice(len(weights), num_samples, p=weights)
+    idxs = sample_indices(weights, num_samples, seed, replace)
     # NB: returning an array would break things
     return [weighted_objects[idx] for idx in idxs]
 
 
+def sample_indices(weights, num_samples, seed, replace=True):
+    """
+    :param weights: a sequence of weights summing up to 1
+    :param num_samples: the number of samples to return
+    :param seed: a random seed
+    :param replace: if False, sample without replacement
+    :returns: an array of `num_samples` indices in the range 0..len(weights)-1
+
+    Sampling without replacement uses Floyd's algorithm if the weights are
+    all equal and `num_samples` is small compared to the number of weights,
+    otherwise the exponential keys method of Efraimidis and Spirakis; in
+    both cases the indices are sorted and zero weights are never taken.
+    """
+    if replace:
+        return _choice_cdf(build_cdf(weights), num_samples, seed)
+    weights = _check_weights(weights)
+    num_weights = len(weights)
+    if num_samples > num_weights:
+        raise ValueError('Cannot take a larger sample than the population '
+                         'when sampling without replacement')
+    nonzero = weights > 0
+    if num_samples > nonzero.sum():
+        raise ValueError('Fewer non-zero weights than samples')
+    numpy.random.seed(seed)
+    if num_samples <= num_weights // 10 and (weights == weights[0]).all():
+        return _floyd(num_weights, num_samples)
+    if num_samples == 0:
+        return numpy.zeros(0, int)
+    # the branches with zero weight get an infinite key and are never taken
+    rnd = numpy.random.random(num_weights)
+    keys = numpy.full(num_weights, numpy.inf)
+    keys[nonzero] = -numpy.log(rnd[nonzero]) / weights[nonzero]
+    return numpy.sort(numpy.argpartition(keys, num_samples - 1)[:num_samples])
+
+
+def _floyd(population, num_samples):
+    # Floyd's algorithm: num_samples distinct integers in range(population)
+    # with num_samples random draws, independently from the population
+    selected = set()
+    for j in range(population - num_samples, population):
+        t = numpy.random.randint(j + 1)
+        selected.add(j if t in selected else t)
+    return numpy.array(sorted(selected), int)
+
+
+def _check_weights(weights):
+    # returns the weights as an array of floats; raise a ValueError if they
+    # are invalid, like numpy.random.choice
+    weights = numpy.array(weights, float)
+    if (weights < 0).any():
+        raise ValueError('probabilities are not non-negative')
+    if abs(weights.sum() - 1.) > numpy.sqrt(numpy.finfo(float).eps):
+        raise ValueError('probabilities do not sum to 1')
+    return weights
+
+
+def build_cdf(weights):
+    """
+    :param weights: a sequence of weights summing up to 1
+    :returns: the normalized cumulative distribution of the weights
+
+    Raise a ValueError if the weights are invalid, like numpy.random.choice
+    """
+    cdf = _check_weights(weights).cumsum()
+    cdf /= cdf[-1]
+    return cdf
+
+
+def _choice_cdf(cdf, num_samples, seed):
+    # same as numpy.random.choice(len(cdf), num_samples, p=weights) but
+    # reusing the cumulative distribution instead of rebuilding it
+    numpy.random.seed(seed)
+    return cdf.searchsorted(numpy.random.random(num_samples), 'right')
+
+
+def _objarray(objects):
+    # build a 1D array of objects, even if the objects look like sequences
+    arr = numpy.empty(len(objects), object)
+    for i, obj in enumerate(objects):
+        arr[i] = obj
+    return arr
+
+
 class Branch(object):
     """
     Branch object, represents a ``<logicTreeBranch />`` element.
@@ -213,6 +298,9 @@ class Branch(object):
         of ``<uncertaintyModel />`` child node. Type depends
         on the branchset's uncertainty type.
     """
+    # NB: there can be a lot of branches, so we avoid the __dict__
+    __slots__ = ('bs_id', 'branch_id', 'weight', 'value', 'bset')
+
     def __init__(self, bs_id, branch_id, weight, value):
         self.bs_id = bs_id
         self.branch_id = branch_id
@@ -240,14 +328,28 @@ GEOMETRY_UNCERTAINTY_TYPES = ['simpleFaultDipRelative',
                               'characteristicFaultGeometryAbsolute']
 
 
-def tomldict(ddic):
+def jsondict(ddic):
+    """
+    :param ddic: a dictionary branchset ID -> branchset attributes
+    :returns: a dictionary branchset ID -> JSON string of the filters
+    """
     out = {}
     for key, dic in ddic.items():
-        out[key] = toml.dumps({k: v.strip() for k, v in dic.items()
-                               if k != 'uncertaintyType'}).strip()
+        out[key] = json.dumps({k: v.strip() for k, v in dic.items()
+                               if k != 'uncertaintyType'})
     return out
 
 
+def _loads_filters(string):
+    # datastores generated by older versions of the engine contain TOML
+    if isinstance(string, bytes):
+        string = string.decode('utf8')
+    try:
+        return json.loads(string)
+    except ValueError:
+        return toml.loads(string)
+
+
 class BranchSet(object):
     """
     Branchset object, represents a ``<logicTreeBranchSet />`` element.
@@ -316,6 +418,45 @@ class BranchSet(object):
         self.branches = []
         self.uncertainty_type = uncertainty_type
         self.filters = filters
+        self._soa = None
+        self._cdf = None
+
+    def _get_soa(self):
+        # build the arrays of branch IDs and weights (a structure of
+        # arrays parallel to .branches) and the index branch_id -> position;
+        # they are rebuilt if branches have been added in the meantime
+        if self._soa is None or len(self._soa[0]) != len(self.branches):
+            brids = _objarray([br.branch_id for br in self.branches])
+            weights = numpy.array([br.weight for br in self.branches])
+            index = {brid: i for i, brid in enumerate(brids)}
+            self._soa = brids, weights, index
+            self._cdf = None
+        return self._soa
+
+    @property
+    def brids(self):
+        """
+        Array with the IDs of the branches
+        """
+        return self._get_soa()[0]
+
+    @property
+    def weights(self):
+        """
+        Array with the weights of the branches
+        """
+        return self._get_soa()[1]
+
+    @property
+    def cdf(self):
+        """
+        Cumulative distribution of the branch weights, computed once and
+        used to sample the branchset
+        """
+        weights = self.weights  # resets the cdf if branches were added
+        if self._cdf is None:
+            self._cdf = build_cdf(weights)
+        return self._cdf
 
     def enumerate_paths(self):
         """
@@ -354,10 +495,11 @@ class BranchSet(object):
         Return :class:`Branch` object belonging to this branch set with id
         equal to ``branch_id``.
         """
-        for branch in self.branches:
-            if branch.branch_id == branch_id:
-                return branch
-        raise AssertionError("couldn't find branch '%s'" % branch_id)
+        try:
+            idx = self._get_soa()[2][branch_id]
+        except KeyError:
+            raise AssertionError("couldn't find branch '%s'" % branch_id)
+        return self.branches[idx]
 
     def filter_source(self, source):
         # pylint: disable=R0911,R0912
@@ -774,7 +916,8 @@ class SourceModelLogicTree(object):
         branchset = self.root_branchset
         branches = []
         while branchset is not None:
-            [branch] = sample(branchset.branches, 1, seed)
+            [idx] = _choice_cdf(branchset.cdf, 1, seed)
+            branch = branchset.branches[idx]
             branches.append(branch)
             branchset = branch.bset
         return branches
@@ -1214,14 +1357,18 @@ class SourceModelLogicTree(object):
         return collections.Counter(rlz.lt_path for rlz in self)
 
     def __toh5__(self):
-        tbl = []
-        for brid, br in self.branches.items():
-            dic = self.bsetdict[br.bs_id].copy()
-            utype = dic.pop('uncertaintyType')
-            tbl.append((br.bs_id, brid, utype, br.value, br.weight))
         dt = [('branchset', hdf5.vstr), ('branch', hdf5.vstr),
               ('utype', hdf5.vstr), ('uvalue', hdf5.vstr), ('weight', float)]
-        return numpy.array(tbl, dt), tomldict(self.bsetdict)
+        branches = list(self.branches.values())
+        tbl = numpy.zeros(len(branches), dt)
+        tbl['branchset'] = _objarray([br.bs_id for br in branches])
+        tbl['branch'] = _objarray(list(self.branches))
+        tbl['utype'] = _objarray([self.bsetdict[br.bs_id]['uncertaintyType']
+                                  for br in branches])
+        tbl['uvalue'] = _objarray([br.value for br in branches])
+        tbl['weight'] = numpy.fromiter((br.weight for br in branches), float,
+                                       len(branches))
+        return tbl, jsondict(self.bsetdict)
 
 
     def __fromh5__(self, array, attrs):
@@ -1234,8 +1381,10 @@ class SourceModelLogicTree(object):
         for lineno, rec in enumerate(array, 2):
             bs = rec['branchset']
             dic = self.bsetdict[bs]
-            dic['uncertaintyType'] = rec['utype']
-            dic.update(toml.loads(rec['filter'][1:-1].replace('\\n', '\n')))
+            if 'uncertaintyType' not in dic:
+                dic['uncertaintyType'] = rec['utype']
+                if bs in attrs:
+                    dic.update(_loads_filters(attrs[bs]))
             br = Branch(bs, rec['branch'], rec['weight'], rec['uvalue'])
             branches.append(br)
             self.branches[br.branch_id] = br
@@ -1603,44 +1752,58 @@ class GsimLogicTree(object):
         :param seed: random seed
         :returns: n Realization objects
         """
-        brlists = [sample([b for b in self.branches if b.trt == trt],
-                          n, seed + i) for i, trt in enumerate(self.values)]
-        rlzs = []
-        for i in range(n):
-            weight = 1
-            lt_path = []
-            lt_uid = []
-            value = []
-            for brlist in brlists:  # there is branch list for each TRT
-                branch = brlist[i]
-                lt_path.append(branch.id)
-                lt_uid.append(branch.id if branch.effective else '@')
-                weight *= branch.weight
-                value.append(branch.gsim)
-            rlz = Realization(tuple(value), weight, i, tuple(lt_uid))
-            rlzs.append(rlz)
-        return rlzs
+        columns = self._get_columns()
+        idxs = [sample_indices([w['weight'] for w in weights], n, seed + i)
+                for i, (gsims, weights, uids) in enumerate(columns)]
+        weight = numpy.ones(n, object)
+        for (gsims, weights, uids), idx in zip(columns, idxs):
+            weight = weight * weights[idx]  # multiply the ImtWeights
+        return list(self._gen_rlzs(columns, idxs, weight))
 
     def __iter__(self):
         """
         Yield :class:`openquake.commonlib.logictree.Realization` instances
         """
-        groups = []
-        # NB: branches are already sorted
+        columns = self._get_columns()
+        if not columns:  # no tectonic region types
+            yield Realization((), 1, 0, ())
+            return
+        # with T tectonic region types there are T groups and T branches;
+        # the realizations are ordered as in itertools.product, so the
+        # subtree of each branch of the first group can be enumerated
+        # independently and streamed, without building all the weights
+        shape = tuple(len(gsims) for gsims, weights, uids in columns)
+        num_sub = int(numpy.prod(shape[1:]))
+        sub_idxs = numpy.indices(shape[1:]).reshape(len(shape) - 1, num_sub)
+        for k in range(shape[0]):
+            # the weights are the products of the branch weights in the
+            # same order as in a loop over the branches of each path
+            weight = numpy.ones(1, object) * columns[0][1][k:k + 1]
+            for gsims, weights, uids in columns[1:]:
+                weight = numpy.multiply.outer(weight, weights).ravel()
+            idxs = [numpy.full(num_sub, k)] + list(sub_idxs)
+            yield from self._gen_rlzs(columns, idxs, weight, k * num_sub)
+
+    def _get_columns(self):
+        # returns a triple of object arrays (gsims, weights, branch IDs)
+        # for each TRT; NB: branches are already sorted
+        columns = []
         for trt in self.values:
-            groups.append([b for b in self.branches if b.trt == trt])
-        # with T tectonic region types there are T groups and T branches
-        for i, branches in enumerate(itertools.product(*groups)):
-            weight = 1
-            lt_path = []
-            lt_uid = []
-            value = []
-            for trt, branch in zip(self.values, branches):
-                lt_path.append(branch.id)
-                lt_uid.append(branch.id if branch.effective else '@')
-                weight *= branch.weight
-                value.append(branch.gsim)
-            yield Realization(tuple(value), weight, i, tuple(lt_uid))
+            branches = [b for b in self.branches if b.trt == trt]
+            columns.append((_objarray([b.gsim for b in branches]),
+                            _objarray([b.weight for b in branches]),
+                            _objarray([b.id if b.effective else '@'
+                                       for b in branches])))
+        return columns
+
+    def _gen_rlzs(self, columns, idxs, weight, start=0):
+        # yield len(weight) realizations with ordinals starting from start;
+        # idxs contains an array of branch indices for each TRT
+        gsims = [col[0][idx] for col, idx in zip(columns, idxs)]
+        uids = [col[2][idx] for col, idx in zip(columns, idxs)]
+        for i in range(len(weight)):
+            yield Realization(tuple(g[i] for g in gsims), weight[i],
+                              start + i, tuple(u[i] for u in uids))
 
     def __repr__(self):
         lines = ['%s,%s,%s,w=%s' %
@@ -23,9 +23,12 @@ Tests for python logic tree processor.
 import os
 import unittest.mock as mock
 import codecs
+import itertools
+import json
 import unittest
 import collections
 
+import toml
 import numpy
 from xml.parsers.expat import ExpatError
 from copy import deepcopy
@@ -1317,6 +1320,46 @@ class SampleTestCase(unittest.TestCase):
         for b in bs:
             self.assertEqual(b.branch_id, 0)
 
+    def test_sample_indices(self):
+        # the cached CDF gives the same indices as numpy.random.choice
+        weights = [0.1, 0.25, 0.05, 0.6]
+        for seed in range(10):
+            numpy.random.seed(seed)
+            expected = numpy.random.choice(4, 100, p=weights)
+            numpy.testing.assert_equal(
+                logictree.sample_indices(weights, 100, seed), expected)
+
+    def test_sample_without_replacement(self):
+        # equal weights and few samples, Floyd's algorithm
+        idxs = logictree.sample_indices([.01] * 100, 5, 42, replace=False)
+        self.assertEqual(len(set(idxs)), 5)
+        numpy.testing.assert_equal(
+            idxs, logictree.sample_indices([.01] * 100, 5, 42, False))
+
+        # different weights, exponential keys
+        weights = [0.1, 0.25, 0.05, 0.6]
+        idxs = logictree.sample_indices(weights, 4, 42, replace=False)
+        self.assertEqual(list(idxs), [0, 1, 2, 3])
+        for seed in range(10):  # the indices are sorted for both algorithms
+            idxs = logictree.sample_indices(weights, 3, seed, replace=False)
+            self.assertEqual(list(idxs), sorted(idxs))
+        counter = collections.Counter(
+            logictree.sample_indices(weights, 1, seed, replace=False)[0]
+            for seed in range(1000))
+        self.assertEqual(counter, {3: 628, 1: 235, 0: 86, 2: 51})
+
+        with self.assertRaises(ValueError):
+            logictree.sample_indices(weights, 5, 42, replace=False)
+
+        # zero weights are never taken, without warnings
+        weights = [0.5, 0., 0.5, 0.]
+        with numpy.errstate(all='raise'):
+            for seed in range(10):
+                idxs = logictree.sample_indices(weights, 2, seed, False)
+                self.assertEqual(list(idxs), [0, 2])
+        with self.assertRaises(ValueError):
+            logictree.sample_indices(weights, 3, 42, replace=False)
+
 
 class BranchSetEnumerateTestCase(unittest.TestCase):
     def test_enumerate(self):
@@ -1368,6 +1411,9 @@ class BranchSetGetBranchByIdTestCase(unittest.TestCase):
         self.assertIs(bs.get_branch_by_id('1'), b1)
         self.assertIs(bs.get_branch_by_id('2'), b2)
         self.assertIs(bs.get_branch_by_id('bzz'), bbzz)
+        self.assertEqual(list(bs.brids), ['1', '2', 'bzz'])
+        numpy.testing.assert_equal(bs.weights, [0.33, 0.33, 0.34])
+        numpy.testing.assert_allclose(bs.cdf, [0.33, 0.66, 1.])
 
     def test_nonexistent_branch(self):
         bs = logictree.BranchSet(None, None)
@@ -1375,6 +1421,18 @@ class BranchSetGetBranchByIdTestCase(unittest.TestCase):
         bs.branches.append(br)
         self.assertRaises(AssertionError, bs.get_branch_by_id, 'bz')
 
+    def test_append_after_lookup(self):
+        bs = logictree.BranchSet(None, None)
+        ba = logictree.Branch('BS', 'a', 0.5, None)
+        bs.branches.append(ba)
+        self.assertIs(bs.get_branch_by_id('a'), ba)
+        numpy.testing.assert_equal(bs.weights, [.5])
+        bb = logictree.Branch('BS', 'b', 0.5, None)
+        bs.branches.append(bb)
+        self.assertIs(bs.get_branch_by_id('b'), bb)
+        self.assertEqual(list(bs.brids), ['a', 'b'])
+        numpy.testing.assert_allclose(bs.cdf, [.5, 1.])
+
 
 class BranchSetApplyUncertaintyMethodSignaturesTestCase(unittest.TestCase):
     def test_apply_uncertainty_ab_absolute(self):
@@ -2172,6 +2230,14 @@ class GsimLogicTreeTestCase(unittest.TestCase):
         self.assertEqual(as_model_lt.get_num_paths(), 40)
         self.assertEqual(fs_bg_model_lt.get_num_paths(), 20)
         self.assertEqual(len(list(as_model_lt)), 5 * 4 * 2 * 1)
+        # the realizations are ordered as in itertools.product
+        groups = [[br for br in as_model_lt.branches if br.trt == trt]
+                  for trt in as_model_lt.values]
+        for rlz, brs in zip(as_model_lt, itertools.product(*groups)):
+            self.assertEqual(rlz.lt_path, tuple(br.id for br in brs))
+            self.assertAlmostEqual(
+                rlz.weight['weight'],
+                numpy.prod([br.weight['weight'] for br in brs]))
         effective_rlzs = set(rlz.pid for rlz in fs_bg_model_lt)
         self.assertEqual(len(effective_rlzs), 5 * 4)
 
@@ -2239,6 +2305,15 @@ class LogicTreeProcessorTestCase(unittest.TestCase):
         self.assertEqual(weight['default'], 0.5)
         self.assertEqual(('b2', 'b3'), branch_ids)
 
+    def test_sample_gsim_lt(self):
+        rlzs = self.gmpe_lt.sample(10, 42)
+        self.assertEqual([rlz.ordinal for rlz in rlzs], list(range(10)))
+        self.assertEqual(collections.Counter(rlz.lt_path for rlz in rlzs),
+                         {('b2', 'b3'): 6, ('b1', 'b3'): 4})
+        for rlz in rlzs:
+            self.assertEqual(rlz.weight['weight'], 0.5)
+            self.assertEqual(len(rlz.value), 2)
+
 
 class LogicTreeProcessorParsePathTestCase(unittest.TestCase):
     def setUp(self):
@@ -2293,6 +2368,24 @@ class LogicTreeSourceSpecificUncertaintyTest(unittest.TestCase):
                     msg = "Wrong mmax value assigned to source 'a1'"
                     self.assertIn(src.mfd.max_mag, mags, msg)
 
+    def test_toh5_fromh5(self):
+        fname_ssc = os.path.join(
+            DATADIR, 'source_specific_uncertainty', 'sscLt.xml')
+        ssc_lt = SourceModelLogicTree(fname_ssc)
+        tbl, attrs = ssc_lt.__toh5__()
+        for bs, dic in ssc_lt.bsetdict.items():
+            self.assertEqual(attrs[bs], json.dumps(
+                {k: v for k, v in dic.items() if k != 'uncertaintyType'}))
+        new = object.__new__(SourceModelLogicTree)
+        new.__fromh5__(tbl, attrs)
+        self.assertEqual(new.bsetdict, ssc_lt.bsetdict)
+
+        # branchset filters stored as TOML by older versions of the engine
+        attrs = {bs: toml.dumps(json.loads(attrs[bs])) for bs in attrs}
+        new = object.__new__(SourceModelLogicTree)
+        new.__fromh5__(tbl, attrs)
+        self.assertEqual(new.bsetdict, ssc_lt.bsetdict)
+
     def test_smlt_bad(self):
         # apply to a source that does not exist in the given branch
         path = os.path.join(DATADIR, 'source_specific_uncertainty')
@@ -19,14 +19,46 @@
 """
 Module exports :class:`GregorEtAl2002SInter`.
 """
+import math
+import functools
 import numpy as np
-import copy
 
+from openquake.baselib.performance import numba, compile
 from openquake.hazardlib.gsim.base import GMPE, CoeffsTable
 from openquake.hazardlib import const
 from openquake.hazardlib.imt import PGA, SA
 
 
+@compile
+def _gregor_kernel(vs30, rrup, mag, rock_vs30, cR, cS, mean, sig):
+    # compute mean and standard deviation in a single pass over the sites,
+    # using the rock coefficients cR for vs30 >= rock_vs30 and the soil
+    # coefficients cS otherwise; the coefficients are
+    # (C1, C2, C3, C4, exp(C5), C6, Sig)
+    aR = cR[0] + mag * cR[1] + cR[5] * (mag - 10.) ** 3
+    bR = cR[2] + mag * cR[3]
+    eR = cR[4]
+    aS = cS[0] + mag * cS[1] + cS[5] * (mag - 10.) ** 3
+    bS = cS[2] + mag * cS[3]
+    eS = cS[4]
+    for i in range(len(vs30)):
+        if vs30[i] >= rock_vs30:
+            mean[i] = aR + math.log(rrup[i] + eR) * bR
+            sig[i] = cR[6]
+        else:
+            mean[i] = aS + math.log(rrup[i] + eS) * bS
+            sig[i] = cS[6]
+
+
+class _LazyCoeffs(object):
+    # descriptor returning the coefficient table parsed on first use
+    def __init__(self, rock):
+        self.rock = rock
+
+    def __get__(self, obj, cls):
+        return cls._coeffs(self.rock)
+
+
 class GregorEtAl2002SInter(GMPE):
     """
     Implements GMPE developed by N.J. Gregor, W.J. Silva, I.G. Wong, and R.R. Young and published as "Ground-Motion Attenuation Relationships for Cascadia Subduction Zone Megathrust Earthquakes" (Bulletin of the Seismological Society of America Volume 92,
@@ -70,6 +102,18 @@ class GregorEtAl2002SInter(GMPE):
     #: Vs30 value representing typical rock conditions in California.
     ROCK_VS30 = 760
 
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._coeffs(True)
+        self._coeffs(False)
+
+    def __setstate__(self, state):
+        # the coefficient tables must not be parsed inside
+        # get_mean_and_stddevs, so parse them also when unpickling
+        vars(self).update(state)
+        self._coeffs(True)
+        self._coeffs(False)
+
     def get_mean_and_stddevs(self, sites, rup, dists, imt, stddev_types):
         """
         See :meth:`superclass method
@@ -79,45 +123,79 @@ class GregorEtAl2002SInter(GMPE):
         assert all(stddev_type in self.DEFINED_FOR_STANDARD_DEVIATION_TYPES
                    for stddev_type in stddev_types)
 
+        # only the total standard deviation is supported, so stddev_types
+        # is either [TOTAL] or empty, when only the mean is required
+        assert len(stddev_types) <= 1, stddev_types
+
         mean = np.zeros_like(sites.vs30)
         stddevs = [np.zeros_like(sites.vs30) for _ in stddev_types]
 
-        idx_rock = sites.vs30 >= self.ROCK_VS30
-        idx_soil = sites.vs30 < self.ROCK_VS30
-
-        if idx_rock.any():
-            C = self.COEFFS_ROCK[imt]
-            self._compute_mean(C, rup.mag, 
-                               dists.rrup, mean, idx_rock)
-            self._compute_std(C, stddevs, idx_rock)
+        if numba:
+            sig = stddevs[0] if stddevs else np.empty_like(mean)
+            _gregor_kernel(sites.vs30, dists.rrup, float(rup.mag),
+                           float(self.ROCK_VS30), self._coef(imt, True),
+                           self._coef(imt, False), mean, sig)
+            return mean, stddevs
 
+        idx_rock = sites.vs30 >= self.ROCK_VS30
+        n_rock = idx_rock.sum()
+        if n_rock == len(idx_rock):  # only rock sites
+            groups = [(slice(None), True)]
+        elif n_rock == 0:  # only soil sites
+            groups = [(slice(None), False)]
+        else:
+            groups = [(idx_rock, True), (~idx_rock, False)]
 
-        if idx_soil.any():
-            C = self.COEFFS_SOIL[imt]
-            self._compute_mean(C, rup.mag,
-                               dists.rrup, mean, idx_soil)
-            self._compute_std(C, stddevs, idx_soil)
+        for idx, rock in groups:
+            coef = self._coef(imt, rock)
+            self._compute_mean(coef, rup.mag, dists.rrup[idx], mean, idx)
+            if stddevs:
+                stddevs[0][idx] = coef[6]
 
         return mean, stddevs
 
-    def _compute_mean(self, C, mag, rrup, mean, idx):
+    @classmethod
+    @functools.lru_cache(None)
+    def _coeffs(cls, rock):
         """
-        Compute mean for subduction interface events, as explained in table 2,
-        page 67.
+        :param rock: True for the rock coefficients, False for the soil ones
+        :returns: the corresponding CoeffsTable, parsed on first use
         """
-        mean[idx] = ( C['C1'] + mag * C['C2'] + (np.log(rrup[idx] + np.exp(C['C5']))) * (C['C3'] + mag * C['C4']) + C['C6'] * (mag - 10) ** 3 )
+        return CoeffsTable(sa_damping=5, table=cls._COEFFS_ROCK_RAW
+                           if rock else cls._COEFFS_SOIL_RAW)
 
-    def _compute_std(self, C, stddevs, idx):
+    @classmethod
+    @functools.lru_cache(None)
+    def _coef(cls, imt, rock):
         """
-        Collect standard deviation of calculation.
+        :param imt: an intensity measure type
+        :param rock: True for the rock coefficients, False for the soil ones
+        :returns: a tuple (C1, C2, C3, C4, exp(C5), C6, Sig)
         """
+        C = cls._coeffs(rock)[imt]
+        return (C['C1'], C['C2'], C['C3'], C['C4'], math.exp(C['C5']),
+                C['C6'], C['Sig'])
 
-        for stddev in stddevs:
-            stddev[idx] += C['Sig'] 
+    def _compute_mean(self, coef, mag, rrup, mean, idx):
+        """
+        Compute mean for subduction interface events, as explained in table 2,
+        page 67. ``idx`` is a boolean mask or a slice and ``rrup`` contains
+        only the distances of the sites it selects; the expression is
+        evaluated in place on a single buffer.
+        """
+        C1, C2, C3, C4, exp_C5, C6, _ = coef
+        tmp = np.empty_like(rrup)
+        np.add(rrup, exp_C5, out=tmp)
+        np.log(tmp, out=tmp)
+        tmp *= C3 + mag * C4
+        tmp += C1 + mag * C2 + C6 * (mag - 10.) ** 3
+        mean[idx] = tmp
 
     #: Coefficient table containing soil coefficients,
     #: taken from table 3
-    COEFFS_SOIL = CoeffsTable(sa_damping=5, table="""\
+    COEFFS_SOIL = _LazyCoeffs(rock=False)
+
+    _COEFFS_SOIL_RAW = """\
     IMT       C1         C2          C3        C4        C5    C6        Sig
     pga       23.8613    -2.2742     -4.8803   0.4399    4.7   0.0366    0.5436
     0.010     25.4516    -2.4206     -5.1071   0.4605    4.8   0.0372    0.5422
@@ -145,11 +223,13 @@ class GregorEtAl2002SInter(GMPE):
     2.000     17.9124    -1.7505     -3.8150   0.3574    4.1   0.0583    0.6276
     2.500     16.1666    -1.5091     -3.7101   0.3344    4.1   0.0473    0.6676
     5.000     7.4856     -0.8360     -2.0627   0.1779    -0.2  0.0821    0.8207
-        """)
+        """
 
     #: Coefficient table containing rock coefficients,
     #: taken from table 2
-    COEFFS_ROCK = CoeffsTable(sa_damping=5, table="""\
+    COEFFS_ROCK = _LazyCoeffs(rock=True)
+
+    _COEFFS_ROCK_RAW = """\
     IMT   C1        C2         C3       C4       C5     C6        Sig
     pga   21.0686   -1.7712    -5.0631   0.4153   4.2    0.0017   0.7240
     0.010 20.9932   -1.7658    -5.0404   0.4132   4.2    0.0226   0.7195
@@ -177,8 +257,4 @@ class GregorEtAl2002SInter(GMPE):
     2.000 8.657     -0.851     -2.7398   0.2339   2.8    0.0370   0.6305
     2.500 6.637     -0.651     -2.3124   0.1879   2.8    0.0364   0.6657
     5.000 8.013     -0.943     -2.4087   0.2154   2.3    0.0647   0.7730
-        """)
-
-
-
-
+        """
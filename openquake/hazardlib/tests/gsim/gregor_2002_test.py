@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+#
+# Copyright (C) 2020 GEM Foundation
+#
+# OpenQuake is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
+import unittest
+import unittest.mock as mock
+
+import numpy
+
+from openquake.hazardlib import const
+from openquake.hazardlib.imt import PGA, SA
+from openquake.hazardlib.contexts import (
+    SitesContext, RuptureContext, DistancesContext)
+from openquake.hazardlib.gsim import gregor_2002
+from openquake.hazardlib.gsim.gregor_2002 import GregorEtAl2002SInter
+
+from openquake.hazardlib.tests.gsim.utils import BaseGSIMTestCase
+
+# the tables contain both calls with mixed rock and soil sites and
+# calls with only rock sites (mag 6.5) or only soil sites (mag 7)
+MEAN_FILE = 'GREGOR02/GREGOR02_SINTER_MEAN.csv'
+STD_FILE = 'GREGOR02/GREGOR02_SINTER_STD_TOTAL.csv'
+
+
+class GregorEtAl2002SInterTestCase(BaseGSIMTestCase):
+    GSIM_CLASS = GregorEtAl2002SInter
+
+    # Test data generated from the OpenQuake implementation prior to
+    # the introduction of the numba kernel
+
+    def test_mean(self):
+        self.check(MEAN_FILE, max_discrep_percentage=0.1)
+
+    def test_std_total(self):
+        self.check(STD_FILE, max_discrep_percentage=0.1)
+
+    # the NumPy branch is tested also when numba is installed
+
+    @mock.patch.object(gregor_2002, 'numba', None)
+    def test_mean_numpy(self):
+        self.check(MEAN_FILE, max_discrep_percentage=0.1)
+
+    @mock.patch.object(gregor_2002, 'numba', None)
+    def test_std_total_numpy(self):
+        self.check(STD_FILE, max_discrep_percentage=0.1)
+
+    # the kernel branch is tested also when numba is not installed,
+    # in which case _gregor_kernel runs as a plain Python function
+
+    @mock.patch.object(gregor_2002, 'numba', True)
+    def test_mean_kernel(self):
+        self.check(MEAN_FILE, max_discrep_percentage=0.1)
+
+    @mock.patch.object(gregor_2002, 'numba', True)
+    def test_std_total_kernel(self):
+        self.check(STD_FILE, max_discrep_percentage=0.1)
+
+
+class GregorKernelTestCase(unittest.TestCase):
+    RRUP = numpy.array([10., 30., 60., 100., 200., 300.])
+
+    def _get_mean_stddevs(self, vs30, imt, stddev_types):
+        sctx = SitesContext()
+        sctx.vs30 = vs30
+        rctx = RuptureContext()
+        rctx.mag = 8.
+        dctx = DistancesContext()
+        dctx.rrup = self.RRUP
+        return GregorEtAl2002SInter().get_mean_and_stddevs(
+            sctx, rctx, dctx, imt, stddev_types)
+
+    def _check(self, vs30):
+        for imt in (PGA(), SA(0.2), SA(1.0)):
+            with mock.patch.object(gregor_2002, 'numba', None):
+                mean, [std] = self._get_mean_stddevs(
+                    vs30, imt, [const.StdDev.TOTAL])
+                mean0, stds0 = self._get_mean_stddevs(vs30, imt, [])
+            numpy.testing.assert_allclose(mean0, mean, rtol=1E-12)
+            self.assertEqual(stds0, [])
+
+            gsim = GregorEtAl2002SInter()
+            kmean = numpy.zeros_like(vs30)
+            kstd = numpy.zeros_like(vs30)
+            gregor_2002._gregor_kernel(
+                vs30, self.RRUP, 8., float(gsim.ROCK_VS30),
+                gsim._coef(imt, True), gsim._coef(imt, False), kmean, kstd)
+            numpy.testing.assert_allclose(kmean, mean, rtol=1E-12)
+            numpy.testing.assert_allclose(kstd, std, rtol=1E-12)
+
+            with mock.patch.object(gregor_2002, 'numba', True):
+                kmean0, kstds0 = self._get_mean_stddevs(vs30, imt, [])
+            numpy.testing.assert_allclose(kmean0, mean, rtol=1E-12)
+            self.assertEqual(kstds0, [])
+
+    def test_mixed_sites(self):
+        self._check(numpy.array([300., 760., 1100., 400., 760., 200.]))
+
+    def test_rock_sites(self):
+        self._check(numpy.array([760., 800., 1100., 760., 900., 1500.]))
+
+    def test_soil_sites(self):
+        self._check(numpy.array([200., 300., 400., 500., 600., 759.]))